@@ -4,13 +4,26 @@ Download geoip.dat and geosite.dat to local geoip folder
 and restart container if files changed
 """
 import logging
+import functools
 import hashlib
+import json
+import mmap
+import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None  # type: ignore
+
 LOGGING = {
     "handlers": [
         logging.StreamHandler(),
@@ -27,14 +40,17 @@ logger = logging.getLogger(__name__)
 CONTAINER = "xray_server"
 SCRIPT_DIR = Path(__file__).parent.resolve()
 GEOIP_DIR = SCRIPT_DIR / "geoip"
+HTTP_CACHE_FILE = GEOIP_DIR / ".http_cache.json"
 FILES = {
     "geoip.dat": (
-        "https://github.com/Loyalsoldier/v2ray-rules-dat/raw/release/geoip.dat"
+        "https://raw.githubusercontent.com/Loyalsoldier/v2ray-rules-dat/release/geoip.dat"
     ),
     "geosite.dat": (
-        "https://github.com/Loyalsoldier/v2ray-rules-dat/raw/release/geosite.dat"
+        "https://raw.githubusercontent.com/Loyalsoldier/v2ray-rules-dat/release/geosite.dat"
     ),
 }
+CHUNK_SIZE = 1 << 20  # 1 MiB read/write buffer
+SPOOL_SIZE = 64 << 20  # keep downloads up to 64 MiB in memory
 
 
 def run_command(
@@ -56,42 +72,120 @@ def run_command(
         return None
 
 
-def docker_available() -> bool:
-    """Check if docker command is available."""
-    return run_command(["which", "docker"], check=False, capture=True) is not None
-
-
-def container_exists(name: str) -> bool:
-    """Check if Docker container exists."""
+@functools.lru_cache(maxsize=1)
+def list_containers() -> frozenset[str]:
+    """Return names of all Docker containers (one docker ps call per run)."""
     output = run_command(
         ["docker", "ps", "-a", "--format", "{{.Names}}"],
         check=True,
         capture=True,
     )
-    if not output:
-        return False
-    return name in output.splitlines()
+    return frozenset(output.splitlines()) if output else frozenset()
+
+
+def container_exists(name: str) -> bool:
+    """Check if Docker container exists."""
+    return name in list_containers()
 
 
-def get_file_md5(filepath: Path) -> str:
-    """Calculate MD5 hash of a local file."""
-    hash_md5 = hashlib.md5()
+def new_hash():
+    """Create hash object for change detection (BLAKE3 if installed)."""
+    if blake3 is not None:
+        # Spread each 1 MiB chunk across all cores (SIMD within each)
+        return blake3(max_threads=blake3.AUTO)
+    return hashlib.blake2b(digest_size=16)
+
+
+def get_file_digest(filepath: Path) -> str:
+    """Calculate digest of a local file."""
+    # BLAKE3 reads and hashes the file natively, no Python loop or GIL
+    if blake3 is not None and hasattr(blake3, "update_mmap"):
+        hasher = new_hash()
+        hasher.update_mmap(filepath)
+        return hasher.hexdigest()
     with filepath.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        # Ask kernel to start reading the whole file in background
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        hasher = new_hash()
+        # mmap of an empty file is not allowed
+        if not filepath.stat().st_size:
+            return hasher.hexdigest()
+        # Hash whole mapping in a single update(), no Python read loop
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+            return hasher.hexdigest()
+        except (OSError, ValueError):
+            pass
+        # Fallback if file cannot be mapped: read in 1 MiB chunks
+        hasher = new_hash()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        return hasher.hexdigest()
 
 
-def download_file(url: str, dest: Path) -> bool:
-    """Download file from URL to destination path."""
+def load_http_cache() -> dict[str, dict[str, Optional[str]]]:
+    """Load saved ETag / Last-Modified values per file."""
     try:
-        logger.info(f"Downloading {dest.name} ...")
-        with urllib.request.urlopen(url) as response:
-            dest.write_bytes(response.read())
-        return True
-    except Exception as e:
-        logger.warning(f"failed to download {url} - {e}")
-        return False
+        return json.loads(HTTP_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_http_cache(cache: dict[str, dict[str, Optional[str]]]) -> None:
+    """Atomically save ETag / Last-Modified values per file."""
+    temp_file = HTTP_CACHE_FILE.with_suffix(".json.tmp")
+    try:
+        # Make file renames durable before the validators describing them
+        fsync_path(GEOIP_DIR)
+        with open(temp_file, "w") as f:
+            f.write(json.dumps(cache, indent=2) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        temp_file.replace(HTTP_CACHE_FILE)
+    except OSError as e:
+        logger.warning(f"failed to save {HTTP_CACHE_FILE.name} - {e}")
+        temp_file.unlink(missing_ok=True)
+
+
+def open_url(url: str, validators: dict[str, Optional[str]]):
+    """Open URL with conditional headers; return None if not modified."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def download_and_hash(response, buffer) -> str:
+    """Stream response body into file object and return its digest."""
+    hasher = new_hash()
+    received = 0
+    while chunk := response.read(CHUNK_SIZE):
+        buffer.write(chunk)
+        hasher.update(chunk)
+        received += len(chunk)
+    # Bounded read() returns b"" on early close instead of raising
+    expected = response.headers.get("Content-Length")
+    if expected is not None and received != int(expected):
+        raise IOError(f"incomplete read ({received} of {expected} bytes)")
+    return hasher.hexdigest()
+
+
+def fsync_path(path: Path) -> None:
+    """Flush directory entries to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 def restart_container(container: str) -> bool:
@@ -105,41 +199,98 @@ def restart_container(container: str) -> bool:
         return False
 
 
+def process(
+    name: str, url: str, cache: dict[str, dict[str, Optional[str]]]
+) -> tuple[str, bool]:
+    """Download one file and replace the local copy if it changed."""
+    dest = GEOIP_DIR / name
+    temp_dest = dest.with_suffix(dest.suffix + ".tmp")
+    # Send validators only if there is a local copy to keep
+    validators = cache.get(name, {}) if dest.exists() else {}
+    try:
+        logger.info(f"Downloading {name} ...")
+        response = open_url(url, validators)
+    except Exception as e:
+        logger.warning(f"failed to download {url} - {e}")
+        return name, False
+    if response is None:
+        logger.info(f"{name} is up to date (not modified)")
+        return name, False
+    with response, tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as buffer:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Different size means changed file, no need to hash current copy
+            size = response.headers.get("Content-Length")
+            old_future = None
+            if dest.exists() and (size is None or int(size) == dest.stat().st_size):
+                # Hash current copy in background while the new one downloads
+                old_future = executor.submit(get_file_digest, dest)
+            elif dest.exists():
+                logger.info(f"{name} size changed ({dest.stat().st_size} -> {size})")
+            try:
+                # Download into memory buffer, hashing on the fly
+                new_digest = download_and_hash(response, buffer)
+            except Exception as e:
+                logger.warning(f"failed to download {url} - {e}")
+                return name, False
+            old_digest = old_future.result() if old_future else None
+        # Validators for the next conditional request, saved only once
+        # the local copy matches this response
+        new_validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if old_digest:
+            logger.info(f"Current {name} digest: {old_digest}")
+        logger.info(f"Downloaded {name} digest: {new_digest}")
+        # Nothing is written to disk if file is unchanged
+        if new_digest == old_digest:
+            logger.info(f"{name} is up to date")
+            cache[name] = new_validators
+            return name, False
+        logger.info(f"File {name} has changed - updating local copy...")
+        buffer.seek(0)
+        try:
+            with open(temp_dest, "wb") as f:
+                shutil.copyfileobj(buffer, f, CHUNK_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
+            temp_dest.replace(dest)
+        except OSError as e:
+            logger.warning(f"failed to write {dest} - {e}")
+            temp_dest.unlink(missing_ok=True)
+            return name, False
+        cache[name] = new_validators
+        return name, True
+
+
 def main() -> int:
     """Main entry point."""
-    # Check Docker availability
-    if not docker_available():
+    # Check container existence (also tells if docker is available)
+    try:
+        exists = container_exists(CONTAINER)
+    except FileNotFoundError:
         logger.error("docker command not found in PATH")
         return 1
-    # Check container existence
-    if not container_exists(CONTAINER):
+    except subprocess.CalledProcessError as e:
+        logger.error(f"docker ps failed: {(e.stderr or '').strip()}")
+        return 1
+    if not exists:
         logger.error(f"container {CONTAINER} not found")
         return 1
     # Ensure geoip directory exists
     GEOIP_DIR.mkdir(exist_ok=True)
     changed = False
-    for name, url in FILES.items():
-        dest = GEOIP_DIR / name
-        old_md5 = None
-        # Get current MD5 if file exists
-        if dest.exists():
-            old_md5 = get_file_md5(dest)
-            logger.info(f"Current {name} MD5: {old_md5}")
-        # Download file to temporary location first
-        temp_dest = dest.with_suffix(dest.suffix + ".tmp")
-        if not download_file(url, temp_dest):
-            continue
-        # Calculate new MD5
-        new_md5 = get_file_md5(temp_dest)
-        logger.info(f"Downloaded {name} MD5: {new_md5}")
-        # Compare and update if different or missing
-        if new_md5 != old_md5:
-            logger.info(f"File {name} has changed - updating local copy...")
-            temp_dest.replace(dest)
-            changed = True
-        else:
-            logger.info(f"{name} is up to date")
-            temp_dest.unlink()
+    cache = load_http_cache()
+    # Download and hash all files concurrently
+    with ThreadPoolExecutor(max_workers=len(FILES)) as executor:
+        futures = [
+            executor.submit(process, name, url, cache) for name, url in FILES.items()
+        ]
+        for future in as_completed(futures):
+            _, updated = future.result()
+            changed = changed or updated
+    # Also flushes directory, so all renames are persisted first
+    save_http_cache(cache)
     # Restart container if any file was updated
     if changed:
         if restart_container(CONTAINER):
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import argparse
+import functools
 import hashlib
 import logging
 import ipaddress
@@ -9,7 +10,7 @@ import subprocess
 import sys
 import urllib.request
 from pathlib import Path
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional
 
 try:
     from jinja2 import Environment, FileSystemLoader
@@ -35,6 +36,9 @@ CLIENT_DIR = Path(__file__).resolve().parent
 ENV_FILE = CLIENT_DIR / ".env"
 TEMPLATE_FILE = CLIENT_DIR / "config_client.j2"
 OUTPUT_CONFIG = CLIENT_DIR / "config_client.json"
+JINJA_ENV = Environment(
+    loader=FileSystemLoader(str(CLIENT_DIR)), auto_reload=False, cache_size=-1
+)
 
 REQUIRED_ENV_KEYS = [
     "ARCH",
@@ -108,6 +112,17 @@ def detect_arch() -> str:
     return run(["dpkg", "--print-architecture"])
 
 
+@functools.lru_cache(maxsize=1)
+def read_os_release() -> Dict[str, str]:
+    os_release = {}
+    with open("/etc/os-release") as f:
+        for line in f:
+            if "=" in line:
+                k, v = line.strip().split("=", 1)
+                os_release[k] = v.strip('"')
+    return os_release
+
+
 # .env Handling
 
 
@@ -185,8 +200,7 @@ def render_template(
         if len(tagged_servers) > 1
         else tagged_servers[0]["tag"]
     )
-    jenv = Environment(loader=FileSystemLoader(str(CLIENT_DIR)))
-    template = jenv.get_template(TEMPLATE_FILE.name)
+    template = JINJA_ENV.get_template(TEMPLATE_FILE.name)
     rendered = template.render(
         servers=tagged_servers, domain_outbound_tag=domain_outbound_tag
     )
@@ -227,13 +241,8 @@ def shutil_which(cmd: str):
     return which(cmd)
 
 
-def install_docker(dry_run: bool):
-    os_release = {}
-    with open("/etc/os-release") as f:
-        for line in f:
-            if "=" in line:
-                k, v = line.strip().split("=", 1)
-                os_release[k] = v.strip('"')
+def install_docker(dry_run: bool, arch: Optional[str] = None):
+    os_release = read_os_release()
     distro = os_release.get("ID", "")
     logger.info(f"Detected distro: {distro}")
 
@@ -311,7 +320,8 @@ Signed-By: /etc/apt/keyrings/docker.asc
         )
         if not dry_run:
             os.chmod("/etc/apt/keyrings/docker.asc", 0o644)
-        line = f"deb [arch={run(['dpkg','--print-architecture'])} signed-by=/etc/apt/keyrings/docker.asc] https://download.docker.com/linux/raspbian {os_release.get('VERSION_CODENAME','stable')} stable"
+        arch = arch or detect_arch()
+        line = f"deb [arch={arch} signed-by=/etc/apt/keyrings/docker.asc] https://download.docker.com/linux/raspbian {os_release.get('VERSION_CODENAME','stable')} stable"
         if dry_run:
             logger.info(line)
         else:
@@ -376,10 +386,10 @@ def download_geoip_files(dry_run: bool):
     geoip_dir = CLIENT_DIR / "geoip"
     files = {
         "geoip.dat": (
-            "https://github.com/Loyalsoldier/v2ray-rules-dat/raw/release/geoip.dat"
+            "https://raw.githubusercontent.com/Loyalsoldier/v2ray-rules-dat/release/geoip.dat"
         ),
         "geosite.dat": (
-            "https://github.com/Loyalsoldier/v2ray-rules-dat/raw/release/geosite.dat"
+            "https://raw.githubusercontent.com/Loyalsoldier/v2ray-rules-dat/release/geosite.dat"
         ),
     }
 
@@ -395,16 +405,28 @@ def download_geoip_files(dry_run: bool):
 
     for name, url in files.items():
         dest = geoip_dir / name
+        temp_dest = dest.with_suffix(dest.suffix + ".tmp")
         try:
             logger.info(f"  Downloading {name}...")
-            with urllib.request.urlopen(url) as response:
-                content = response.read()
-                dest.write_bytes(content)
-                # Calculate MD5
-                md5 = hashlib.md5(content).hexdigest()
-                logger.info(f"  {name} (MD5: {md5[:16]}...)")
+            # Stream to temp file in 1 MiB chunks, hashing on the fly
+            hash_md5 = hashlib.md5()
+            received = 0
+            with urllib.request.urlopen(url) as response, temp_dest.open("wb") as f:
+                while chunk := response.read(1 << 20):
+                    f.write(chunk)
+                    hash_md5.update(chunk)
+                    received += len(chunk)
+                expected = response.headers.get("Content-Length")
+            # Bounded read() returns b"" on early close instead of raising
+            if expected is not None and received != int(expected):
+                raise IOError(f"incomplete read ({received} of {expected} bytes)")
+            # Keep existing file until the new one is complete
+            temp_dest.replace(dest)
+            md5 = hash_md5.hexdigest()
+            logger.info(f"  {name} (MD5: {md5[:16]}...)")
         except Exception as e:
             logger.warning(f"  failed to download {name}: {e}")
+            temp_dest.unlink(missing_ok=True)
 
 
 # Confirmation
@@ -536,7 +558,7 @@ def main():
     # System configuration
     enable_ip_forward(dry_run)
     firewall_forward_accept(dry_run)
-    install_docker(dry_run)
+    install_docker(dry_run, env.get("ARCH"))
 
     # Download geoip files
     download_geoip_files(dry_run)
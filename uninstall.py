@@ -19,13 +19,17 @@ Exit codes:
   2 invalid invocation
   >0 runtime errors
 """
-import argparse
+import functools
+import json
 import logging
 import os
+import shlex
+import shutil
+import socket
 import subprocess
 import sys
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
 
 LOGGING = {
@@ -45,12 +49,64 @@ CLIENT_DIR = Path(__file__).resolve().parent
 CONFIG_FILE = CLIENT_DIR / "config_client.json"
 ENV_FILE = CLIENT_DIR / ".env"
 CONTAINERS = ["xray_server", "xray_tun2socks"]
+DOCKER_SOCKET = "/var/run/docker.sock"
 
 
 # Helpers 
 
+def spawn_capture(cmd: List[str]) -> Tuple[int, str]:
+    """Run command via posix_spawn; return (exit code, stdout)."""
+    read_fd, write_fd = os.pipe()
+    try:
+        pid = os.posix_spawnp(
+            cmd[0],
+            cmd,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, write_fd, 1),
+                (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+            ],
+        )
+    except OSError:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    out = bytearray()
+    try:
+        with os.fdopen(read_fd, "rb", buffering=0) as f:
+            while chunk := f.read(65536):
+                out.extend(chunk)
+    finally:
+        # Always reap the child, even if reading was interrupted
+        _, status = os.waitpid(pid, 0)
+    # Negative signal number if killed, as subprocess reports it
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status)
+    return returncode, out.decode().strip()
+
+
+def run_status(cmd: List[str]) -> Tuple[int, str]:
+    """Return (exit code, stdout), keeping stdout even if the command failed."""
+    logger.info("+ %s", " ".join(cmd))
+    # Lighter fork/exec for read-only queries
+    if hasattr(os, "posix_spawnp"):
+        return spawn_capture(cmd)
+    result = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    return result.returncode, result.stdout.strip()
+
+
 def run(cmd: List[str], check: bool = True, capture: bool = True) -> Optional[str]:
-    logger.info(f"+ {' '.join(cmd)}")
+    """Return stdout ("" if not captured), or None if the command failed."""
+    # Read-only queries whose failure is tolerated
+    if capture and not check:
+        returncode, out = run_status(cmd)
+        return out if returncode == 0 else None
+    logger.info("+ %s", " ".join(cmd))
     try:
         result = subprocess.run(
             cmd,
@@ -59,55 +115,112 @@ def run(cmd: List[str], check: bool = True, capture: bool = True) -> Optional[st
             text=True,
             check=check,
         )
-        return result.stdout.strip() if capture else None
     except subprocess.CalledProcessError as e:
-        if check:
-            print(e.stdout)
-            print(e.stderr, file=sys.stderr)
-            raise
+        print(e.stdout)
+        print(e.stderr, file=sys.stderr)
+        raise
+    if result.returncode != 0:
         return None
+    return result.stdout.strip() if capture else ""
 
 
+@functools.lru_cache(maxsize=1)
 def docker_available() -> bool:
-    return run(["which", "docker"], check=False) is not None
+    """Check that docker is installed and its daemon accepts connections."""
+    if shutil.which("docker") is None:
+        return False
+    host = os.environ.get("DOCKER_HOST", "")
+    if host and not host.startswith("unix://"):
+        return True  # remote daemon, leave it to docker CLI
+    path = host[len("unix://"):] if host else DOCKER_SOCKET
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.2)
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
 
 
-def container_exists(name: str) -> bool:
+@functools.lru_cache(maxsize=1)
+def list_containers() -> FrozenSet[str]:
     out = run(["docker", "ps", "-a", "--format", "{{.Names}}"], check=False) or ""
-    return name in out.splitlines()
+    # Parsed once; immutable since the cached object is shared by callers
+    return frozenset(out.splitlines())
+
+
+def inspect_many(names: List[str]) -> Dict[str, str]:
+    """Return {container name: image id} with a single docker inspect."""
+    if not names:
+        return {}
+    # Non-zero exit if any name vanished since docker ps; the objects
+    # that were found are still printed, so parse them regardless
+    returncode, out = run_status(
+        ["docker", "inspect", "--format", "{{json .}}", *names]
+    )
+    if returncode != 0:
+        logger.warning(
+            "docker inspect failed (exit %s), using partial output", returncode
+        )
+    images = {}
+    for line in out.splitlines():
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        images[data["Name"].lstrip("/")] = data["Image"]
+    return images
 
 
-def get_container_image_id(name: str) -> Optional[str]:
-    if not container_exists(name):
-        return None
-    out = run(["docker", "inspect", "--format", "{{.Image}}", name], check=False)
-    return out if out else None
+def remove_containers_cmd(names: List[str]) -> str:
+    """Shell line removing all given containers, one docker call per step."""
+    # kill returns once signal is sent; its error for already stopped
+    # containers is expected, so keep it off the terminal
+    kill = shlex.join(["docker", "kill", *names])
+    rm = shlex.join(["docker", "rm", *names])
+    force = shlex.join(["docker", "rm", "-f", *names])
+    return f"{kill} 2>/dev/null; {rm} || {force}"
+
 
+def remove_image_cmd(image_id: str) -> str:
+    return shlex.join(["docker", "rmi", image_id])
 
-def remove_container(name: str, dry_run: bool):
-    if not container_exists(name):
-        logger.info(f"- Container {name} not found (skip)")
+
+def run_batch(cmds: List[str], dry_run: bool):
+    """Run shell lines in one sh process; later lines run even if one fails."""
+    if not cmds:
         return
+    script = "; ".join(cmds)
     if dry_run:
-        logger.info(f"(dry-run) Would remove container {name}")
+        logger.info("(dry-run) Would run: %s", script)
         return
-    run(["docker", "rm", "-f", name], check=False)
+    run(["sh", "-c", script], check=False, capture=False)
 
 
-def remove_image(image_id: str, dry_run: bool):
+def safe_unlink(path: Path, dry_run: bool, present: bool):
+    if not present:
+        logger.info("%s not present (skip)", path)
+        return
     if dry_run:
-        logger.info(f"(dry-run) Would remove image {image_id}")
+        logger.info("(dry-run) Would delete %s", path)
         return
-    run(["docker", "rmi", image_id], check=False)
+    # Presence comes from the caller's directory scan; unlink directly
+    try:
+        path.unlink()
+        logger.info("Removed %s", path)
+    except FileNotFoundError:
+        logger.info("%s not present (skip)", path)
+    except OSError as e:
+        logger.warning("Failed to remove %s: %s", path, e)
 
 
 def summarize(dry_run: bool, remove_env: bool):
     logger.info("Targets:")
     for c in CONTAINERS:
-        logger.info(f"  - container: {c}")
-    logger.info(f"  - file: {CONFIG_FILE} (if exists)")
+        logger.info("  - container: %s", c)
+    logger.info("  - file: %s (if exists)", CONFIG_FILE)
     if remove_env:
-        logger.info(f"  - file: {ENV_FILE} (will remove)")
+        logger.info("  - file: %s (will remove)", ENV_FILE)
     logger.info("  - image: tun2socks build image (if found)")
     if dry_run:
         logger.info("DRY-RUN: no changes will be applied")
@@ -131,6 +244,9 @@ def main() -> int:
         logger.error("Must be run as root (sudo). Exiting.")
         return 2
 
+    # Imported only when actually running, not for non-root invocations
+    import argparse
+
     parser = argparse.ArgumentParser(description="Uninstall Xray client and tun2socks")
     parser.add_argument(
         "--dry-run", action="store_true", help="Show what would be done"
@@ -145,7 +261,7 @@ def main() -> int:
     remove_env = args.remove_env
 
     if not docker_available():
-        logger.warning("Docker not found. Only files will be removed.")
+        logger.warning("Docker not found or not running. Only files will be removed.")
 
     summarize(dry_run, remove_env)
 
@@ -153,49 +269,44 @@ def main() -> int:
         if not confirm(dry_run):
             return 0
 
-    # Record image id of tun2socks BEFORE removing container
-    tun2socks_image_id = (
-        get_container_image_id("xray_tun2socks") if docker_available() else None
-    )
+    # List containers once, reused by all existence checks
+    existing = list_containers() if docker_available() else frozenset()
+    names = [c for c in CONTAINERS if c in existing]
+
+    # Record image ids BEFORE removing containers
+    images = inspect_many(names)
+    tun2socks_image_id = images.get("xray_tun2socks")
+
+    # Collect docker commands, run them all with a single sh
+    cmds = []
 
     # Remove containers
     if docker_available():
         for c in CONTAINERS:
-            remove_container(c, dry_run)
+            if c not in existing:
+                logger.info("- Container %s not found (skip)", c)
+    if names:
+        cmds.append(remove_containers_cmd(names))
 
     # Remove tun2socks image if identified and not a library image
     if tun2socks_image_id:
         # Avoid accidental deletion of base images; simple heuristic length + not sha256 prefix
         if len(tun2socks_image_id) > 8:
-            remove_image(tun2socks_image_id, dry_run)
+            cmds.append(remove_image_cmd(tun2socks_image_id))
         else:
-            logger.warning(f"Skip image removal (unexpected id: {tun2socks_image_id})")
+            logger.warning("Skip image removal (unexpected id: %s)", tun2socks_image_id)
+
+    run_batch(cmds, dry_run)
+
+    # One directory read instead of a stat per file
+    present = {entry.name for entry in os.scandir(CLIENT_DIR)}
 
     # Remove config file
-    if CONFIG_FILE.exists():
-        if dry_run:
-            logger.info(f"(dry-run) Would delete {CONFIG_FILE}")
-        else:
-            try:
-                CONFIG_FILE.unlink()
-                logger.info(f"Removed {CONFIG_FILE}")
-            except Exception as e:
-                logger.warning(f"Failed to remove {CONFIG_FILE}: {e}")
-    else:
-        logger.info(f"{CONFIG_FILE} not present (skip)")
+    safe_unlink(CONFIG_FILE, dry_run, CONFIG_FILE.name in present)
 
     # Optional remove .env
-    if remove_env and ENV_FILE.exists():
-        if dry_run:
-            logger.info(f"(dry-run) Would delete {ENV_FILE}")
-        else:
-            try:
-                ENV_FILE.unlink()
-                logger.info(f"Removed {ENV_FILE}")
-            except Exception as e:
-                logger.warning(f"Failed to remove {ENV_FILE}: {e}")
-    elif remove_env:
-        logger.info(f"{ENV_FILE} not present (skip)")
+    if remove_env:
+        safe_unlink(ENV_FILE, dry_run, ENV_FILE.name in present)
 
     logger.info("Uninstall complete.")
     return 0